@@ -1,10 +1,21 @@
 # scripts/uci_build_report.py
 from __future__ import annotations
-import os, json, base64, unicodedata
+import os, io, gzip, json, base64, hashlib, unicodedata
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime
 import numpy as np
 import pandas as pd
+try:
+    import orjson  # opcional: serializador JSON en C
+except ImportError:
+    orjson = None
+try:
+    import pyarrow  # noqa: F401  (opcional: lector CSV multihilo, strings Arrow y caché parquet)
+except ImportError:
+    pyarrow = None
+# Dtype de texto: Arrow si está pyarrow (explícito, sin tocar mode.string_storage global)
+STR_DTYPE = "string[pyarrow]" if pyarrow is not None else "string"
 
 ROOT = Path(__file__).resolve().parent.parent
 REPORT_DIR = ROOT / "report"
@@ -17,41 +28,81 @@ GSHEETS_CREDENTIALS_B64 = os.getenv("GSHEETS_CREDENTIALS_B64", "").strip()
 GSHEET_ID = os.getenv("GSHEET_ID", "").strip()
 GSHEET_TAB = os.getenv("GSHEET_TAB", "base")
 TIMEZONE = os.getenv("TZ", "UTC")
+# Filas por bloque al leer el CSV (0 = todo de una vez, con pyarrow si está instalado)
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "0"))
+# DataFrame ya normalizado de la última corrida + ETag/Last-Modified de la hoja; con datos de
+# pacientes, así que fuera de report/ (se publica) y sin versionar
+CACHE_DIR = ROOT / ".cache"
+PREP_CACHE = CACHE_DIR / "prepared.parquet"
+PREP_CACHE_META = CACHE_DIR / "prepared.json"
 
 # ---------- util ----------
+class _CombiningTable(dict):
+    # Tabla de str.translate que se llena a demanda: marca combinante -> None, el resto se
+    # mapea a sí mismo; sólo se consulta cada código visto una vez (sin recorrer todo Unicode)
+    def __missing__(self, c: int):
+        v = self[c] = None if unicodedata.combining(chr(c)) else c
+        return v
+
+_COMBINING = _CombiningTable()
+
+@lru_cache(maxsize=4096)
 def _accent_fold(s: str) -> str:
     if s is None:
         return ""
-    return "".join(c for c in unicodedata.normalize("NFKD", str(s)) if not unicodedata.combining(c))
+    return unicodedata.normalize("NFKD", str(s)).translate(_COMBINING)
+
+def as_text(sr: pd.Series) -> pd.Series:
+    # Texto como STR_DTYPE (kernels .str en C con Arrow); faltantes como "nan", igual que astype(str)
+    return sr.astype(STR_DTYPE).fillna("nan")
 
 def parse_date_series(sr: pd.Series) -> pd.Series:
-    s = sr.astype(str).str.replace("\u00A0", " ").str.strip().replace({"": pd.NA, "NaT": pd.NA, "nan": pd.NA})
-    dt = pd.to_datetime(s, dayfirst=True, errors="coerce")
-    def _fix(y):
-        if pd.isna(y):
-            return pd.NaT
-        if 1000 <= y.year <= 1100:
-            try: return y.replace(year=y.year + 1000)
-            except Exception: return y
-        return y
-    return dt.apply(_fix)
+    s = as_text(sr).str.replace("\u00A0", " ").str.strip().replace({"": pd.NA, "NaT": pd.NA, "nan": pd.NA})
+    # cache=True: se parsea cada fecha distinta una sola vez; "mixed" tolera columnas
+    # que mezclan "dd/mm/aaaa" con "dd/mm/aaaa hh:mm:ss" (la inferencia fija el formato del 1.er valor)
+    dt = pd.to_datetime(s, dayfirst=True, errors="coerce", cache=True, format="mixed")
+    # Años 10xx tipeados sin el "2" inicial (1025 -> 2025); NaT queda fuera de la máscara
+    yrs = dt.dt.year
+    mask = (yrs >= 1000) & (yrs <= 1100)
+    if mask.any():
+        dt.loc[mask] = dt.loc[mask] + pd.DateOffset(years=1000)
+    return dt
+
+_BOOL_MAP = ({k: True for k in ("si","sí","yes","y","1","true","verdadero")}
+             | {k: False for k in ("no","n","0","false","falso")})
 
 def to_bool(sr: pd.Series) -> pd.Series:
-    s = sr.astype(str).str.strip().str.lower()
-    si = {"si","sí","yes","y","1","true","verdadero"}
-    no = {"no","n","0","false","falso"}
-    out = pd.Series(pd.NA, index=sr.index, dtype="boolean")
-    out = out.mask(s.isin(si), True).mask(s.isin(no), False)
-    return out
+    return as_text(sr).str.strip().str.lower().map(_BOOL_MAP).astype("boolean")
 
 def to_int(sr: pd.Series) -> pd.Series:
     return pd.to_numeric(sr, errors="coerce").astype("Int64")
 
+def dumps_json(obj) -> bytes:
+    # UTF-8 sin escapar tildes; orjson si está instalado, si no json estándar
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
 # ---------- load ----------
-def load_from_csv_url(url: str) -> pd.DataFrame:
-    if not url:
-        raise RuntimeError("SHEET_CSV_URL vacío.")
-    return pd.read_csv(url, dtype=str)
+def _csv_dtype() -> dict:
+    # Las columnas numéricas las tipa el lector; el resto queda como texto para normalizar
+    return {orig: str for orig, col in COLMAP.items() if col not in INT_COLS}
+
+def read_sheet_csv(src) -> pd.DataFrame:
+    dtype = _csv_dtype()
+    if pyarrow is None:
+        return pd.read_csv(src, dtype=dtype)
+    # Con pyarrow el texto queda en buffers Arrow durante todo prepare()
+    return pd.read_csv(src, dtype={c: STR_DTYPE for c in dtype}, engine="pyarrow")
+
+def prepare_csv(src) -> pd.DataFrame:
+    # read_sheet_csv() + prepare(); con CSV_CHUNK_ROWS se lee por bloques (lector C: pyarrow no
+    # admite chunksize), sólo con las columnas de KEEP_COLS, y cada bloque se normaliza antes del
+    # siguiente: la memoria pico la marca un bloque y no la hoja entera
+    if not CSV_CHUNK_ROWS: return prepare(read_sheet_csv(src))
+    chunks = pd.read_csv(src, dtype=_csv_dtype(), chunksize=CSV_CHUNK_ROWS,
+                         usecols=lambda c: COLMAP.get(c) in KEEP_COLS)
+    return pd.concat([prepare(c) for c in chunks], ignore_index=True)
 
 def load_from_gsheets_service_account(b64_json: str, sheet_id: str, tab: str="base") -> pd.DataFrame:
     import gspread
@@ -63,15 +114,59 @@ def load_from_gsheets_service_account(b64_json: str, sheet_id: str, tab: str="ba
     creds = Credentials.from_service_account_info(info, scopes=scopes)
     gc = gspread.authorize(creds)
     ws = gc.open_by_key(sheet_id).worksheet(tab)
-    return pd.DataFrame.from_records(ws.get_all_records())
+    values = ws.get_all_values()  # una sola lectura, matriz de texto crudo
+    if not values:
+        return pd.DataFrame()
+    header, *rows = values
+    return pd.DataFrame(rows, columns=header, dtype=str)
 
 def load_data() -> pd.DataFrame:
-    if SHEET_CSV_URL:
-        return load_from_csv_url(SHEET_CSV_URL)
+    # Sólo Service Account: SHEET_CSV_URL (ruta local o http) lo resuelve load_prepared()
     if GSHEETS_CREDENTIALS_B64 and GSHEET_ID:
         return load_from_gsheets_service_account(GSHEETS_CREDENTIALS_B64, GSHEET_ID, GSHEET_TAB)
     raise RuntimeError("Configura SHEET_CSV_URL o las variables de Service Account.")
 
+def read_prepared_cache() -> pd.DataFrame:
+    # El parquet guarda "string" sin el almacenamiento: se restituye STR_DTYPE
+    df = pd.read_parquet(PREP_CACHE)
+    return df.astype({c: STR_DTYPE for c, t in df.dtypes.items() if isinstance(t, pd.StringDtype)})
+
+def load_prepared() -> pd.DataFrame:
+    # Hoja por http(s): GET condicional; si no cambió (304) se reutiliza el DataFrame
+    # normalizado en .cache/prepared.parquet y se saltan descarga, parseo y prepare().
+    # En CI .cache/ persiste entre corridas vía actions/cache (ver uci_report.yml)
+    url = SHEET_CSV_URL
+    if not url: return prepare(load_data())
+    if not url.startswith(("http://", "https://")): return prepare_csv(url)
+    import requests
+    # El hash del script invalida la caché si cambia la normalización
+    key = {"url": url, "script": hashlib.sha1(Path(__file__).read_bytes()).hexdigest()}
+    meta = {}
+    if PREP_CACHE.exists() and PREP_CACHE_META.exists():
+        try: meta = json.loads(PREP_CACHE_META.read_text(encoding="utf-8"))
+        except ValueError: meta = {}
+    headers = {}
+    if all(meta.get(k) == v for k, v in key.items()):
+        if meta.get("etag"): headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"): headers["If-Modified-Since"] = meta["last_modified"]
+    r = requests.get(url, headers=headers, timeout=60)
+    if r.status_code == 304 and headers:
+        # Sin cambios: caché normalizada; si se borró entretanto, se pide de nuevo sin validadores
+        if PREP_CACHE.exists(): return read_prepared_cache()
+        r = requests.get(url, timeout=60)
+    r.raise_for_status()
+    # Sólo un 200 trae el CSV (un 304 no pedido, 204, etc. no tienen cuerpo que parsear)
+    if r.status_code != 200: raise RuntimeError(f"Respuesta inesperada al bajar la hoja: HTTP {r.status_code}")
+    df = prepare_csv(io.BytesIO(r.content))
+    try:
+        CACHE_DIR.mkdir(exist_ok=True)
+        df.to_parquet(PREP_CACHE, compression="zstd")
+        PREP_CACHE_META.write_text(json.dumps({**key, "etag": r.headers.get("ETag"),
+                                               "last_modified": r.headers.get("Last-Modified")}), encoding="utf-8")
+    except (ImportError, OSError):  # sin pyarrow o sin permiso de escritura: sólo se pierde la caché
+        PREP_CACHE_META.unlink(missing_ok=True)
+    return df
+
 # ---------- normalize ----------
 COLMAP = {
   'Marca temporal':'marca_temporal',
@@ -105,6 +200,13 @@ COLMAP = {
   'Observaciones':'obs'
 }
 
+# Columnas que usa export_payload (directas o para calcular los_final)
+KEEP_COLS = {"fec_ing","fec_egr","medico","origen","tipo","cond_egreso","kpc_mbl","vi","los","apache2","sofa48"}
+INT_COLS = ["edad","apache2","sofa48","vvc","cateter_hd","lineas_art","ecg","los","reg_intern","prontuario"]
+# Conversiones de prepare() ya cruzadas con KEEP_COLS al cargar el módulo
+_DATE_COLS = tuple(c for c in ("marca_temporal","fec_nac","fec_ing","fec_egr") if c in KEEP_COLS)
+_INT_COLS = tuple(c for c in INT_COLS if c in KEEP_COLS)
+_BOOL_COLS = tuple(c for c in ("vi","tubo_dren","traqueo","caf","pocus","doppler_tc","fibro") if c in KEEP_COLS)
 def canon_outcome(x: str) -> str:
     if not isinstance(x, str): return ""
     t = _accent_fold(x).lower().strip().rstrip(":")
@@ -129,59 +231,109 @@ def canon_servicio(x: str) -> str:
             "IPS INTERIOR":"IPS Interior","Reanimacion":"Reanimación","Clinica Medica":"Clínica Médica"}
     return repl.get(t, x)
 
+def canon_column(sr: pd.Series, fn) -> pd.Series:
+    # fn se evalúa una vez por valor distinto (decenas) y se mapea por hash al resto de filas
+    s = as_text(sr)
+    u = s.unique()
+    return s.map(dict(zip(u, map(fn, u)))).astype(object)  # object también con 0 filas
+
 def prepare(df_raw: pd.DataFrame) -> pd.DataFrame:
-    df = df_raw.rename(columns=COLMAP).copy()
-    for col in ["marca_temporal","fec_nac","fec_ing","fec_egr"]:
-        if col in df: df[col] = parse_date_series(df[col])
-    for col in ["edad","apache2","sofa48","vvc","cateter_hd","lineas_art","ecg","los","reg_intern","prontuario"]:
-        if col in df: df[col] = to_int(df[col])
-    for col in ["vi","tubo_dren","traqueo","caf","pocus","doppler_tc","fibro"]:
-        if col in df: df[col] = to_bool(df[col])
-    if "cond_egreso" in df: df["cond_egreso"] = df["cond_egreso"].astype(str).map(canon_outcome)
-    if "kpc_mbl" in df: df["kpc_mbl"] = df["kpc_mbl"].astype(str).map(canon_kpc)
-    if "origen" in df: df["origen"] = df["origen"].astype(str).map(canon_servicio)
-    if "tipo" in df: df["tipo"] = df["tipo"].astype(str).str.strip()
-    if "medico" in df: df["medico"] = df["medico"].astype(str).str.strip()
-    if "fec_ing" in df and "fec_egr" in df:
+    # Hoja sin filas (o sin encabezados): se salta el cuerpo y se devuelve el esquema de salida
+    if len(df_raw) == 0: return _prepared_empty().copy()
+    return _prepare_rows(df_raw)
+
+@lru_cache(maxsize=1)
+def _prepared_empty() -> pd.DataFrame:
+    # El esquema sale del camino normal sobre una hoja sólo con encabezados (no se duplica a mano)
+    header_only = pd.DataFrame(columns=list(COLMAP)).to_csv(index=False)
+    return _prepare_rows(read_sheet_csv(io.StringIO(header_only)))
+
+def _prepare_rows(df_raw: pd.DataFrame) -> pd.DataFrame:
+    df = df_raw.rename(columns=COLMAP)
+    df = df[[c for c in df.columns if c in KEEP_COLS]].copy()
+    present = set(df.columns)
+    for col in _DATE_COLS:
+        if col in present: df[col] = parse_date_series(df[col])
+    for col in _INT_COLS:
+        if col in present: df[col] = to_int(df[col])
+    for col in _BOOL_COLS:
+        if col in present: df[col] = to_bool(df[col])
+    if "cond_egreso" in present: df["cond_egreso"] = canon_column(df["cond_egreso"], canon_outcome)
+    if "kpc_mbl" in present: df["kpc_mbl"] = canon_column(df["kpc_mbl"], canon_kpc)
+    if "origen" in present: df["origen"] = canon_column(df["origen"], canon_servicio)
+    if "tipo" in present: df["tipo"] = as_text(df["tipo"]).str.strip()
+    if "medico" in present: df["medico"] = as_text(df["medico"]).str.strip()
+    if "fec_ing" in present and "fec_egr" in present:
         los_calc = (df["fec_egr"] - df["fec_ing"]).dt.days
-        df["los_calc"] = los_calc.where(los_calc >= 0)
-    df["los_final"] = df.get("los").fillna(df.get("los_calc"))
+        df["los_calc"] = los_calc.where(los_calc >= 0).astype("float64")  # float64 aunque no haya NaN
+    if "los" in df and "los_calc" in df:
+        # Coalesce sobre buffers float64 (sin alinear índices) y de vuelta a Int64
+        los = df["los"].to_numpy(dtype="float64", na_value=np.nan)
+        los_calc = df["los_calc"].to_numpy(dtype="float64", na_value=np.nan)
+        df["los_final"] = pd.array(np.where(np.isnan(los), los_calc, los), dtype="Int64")
+    elif "los_calc" in df: df["los_final"] = df["los_calc"]
+    elif "los" in df: df["los_final"] = df["los"]
+    else: df["los_final"] = np.nan
     df = df[df["fec_ing"].notna()].copy()
     return df
 
 # ---------- payload (JSON) ----------
-def export_payload(df: pd.DataFrame) -> dict:
-    def to_iso(d):
-        if pd.isna(d): return None
-        return pd.to_datetime(d).date().isoformat()
-    def yesno(x):
-        if pd.isna(x): return ""
-        return "Sí" if bool(x) else "No"
-    records = []
-    cols = ["fec_ing","fec_egr","medico","origen","tipo","cond_egreso","kpc_mbl","vi","los_final","apache2","sofa48"]
-    for _, r in df[cols].iterrows():
-        records.append({
-            "fec_ing": to_iso(r["fec_ing"]),
-            "fec_egr": to_iso(r["fec_egr"]),
-            "medico": (r["medico"] or "").strip(),
-            "origen": (r["origen"] or "").strip(),
-            "tipo": (r["tipo"] or "").strip(),
-            "cond_egreso": (r["cond_egreso"] or "").strip(),
-            "kpc": (r["kpc_mbl"] or "").strip(),
-            "vi": yesno(r["vi"]),
-            "los": None if pd.isna(r["los_final"]) else int(r["los_final"]),
-            "apache2": None if pd.isna(r["apache2"]) else int(r["apache2"]),
-            "sofa48": None if pd.isna(r["sofa48"]) else int(r["sofa48"]),
-        })
+def export_payload(df: pd.DataFrame) -> tuple[dict, bytes]:
+    # Payload columnar: un arreglo por campo (sin iterrows ni un dict por fila); el texto va
+    # como códigos enteros sobre un diccionario ordenado por campo
+    # Fechas como días enteros desde base_date (primer ingreso): ~3 bytes en vez de 12 por fecha
+    base = df["fec_ing"].min().normalize() if len(df) else pd.NaT
+    def iso(d):
+        return None if pd.isna(d) else d.strftime("%Y-%m-%d")
+    def days(sr):
+        return num((sr.dt.normalize() - base).dt.days)
+    def txt(sr):
+        return sr.fillna("").astype(str).str.strip().to_numpy(dtype=object)
+    def num(sr):
+        # Buffer int64 + máscara NumPy de nulos: sin pasar por Series.where sobre object
+        sr = sr.astype("Int64")
+        out = sr.to_numpy(dtype="int64", na_value=0).astype(object)
+        out[sr.isna().to_numpy()] = None
+        return out.tolist()
+    def yesno(sr):
+        sr = sr.astype("boolean")
+        return np.where(sr.isna(), "", np.where(sr.fillna(False), "Sí", "No")).astype(object)
+    text = {
+        "medico": txt(df["medico"]),
+        "origen": txt(df["origen"]),
+        "tipo": txt(df["tipo"]),
+        "cond_egreso": txt(df["cond_egreso"]),
+        "kpc": txt(df["kpc_mbl"]),
+        "vi": yesno(df["vi"]),
+    }
+    dictionaries, columns = {}, {
+        "fec_ing": days(df["fec_ing"]),
+        "fec_egr": days(df["fec_egr"]),
+        "los": num(df["los_final"]),
+        "apache2": num(df["apache2"]),
+        "sofa48": num(df["sofa48"]),
+    }
+    for k, values in text.items():
+        uniq, codes = np.unique(values, return_inverse=True)
+        dictionaries[k] = uniq.tolist()
+        columns[k] = codes.tolist()
     payload = {
+        # 2: columnar (dictionaries/columns, fechas en días desde base_date); 1 era "records"
+        "schema": 2,
         "updated": datetime.utcnow().strftime("%Y-%m-%d %H:%M") + " UTC",
         "timezone": TIMEZONE,
-        "n": len(records),
-        "records": records
+        "n": len(df),
+        # Última fecha de ingreso ya resuelta (rango por defecto y botones rápidos)
+        "date_max": iso(df["fec_ing"].max()),
+        "base_date": iso(base),
+        "dictionaries": dictionaries,
+        "columns": columns,
     }
     # Guardamos para diagnóstico (puede fallar si .gitignore bloquea, pero no afecta el tablero)
-    (ASSETS_DIR / "data.json").write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
-    return payload
+    # Se serializa una sola vez: los mismos bytes van a data.json y al HTML
+    blob = dumps_json(payload)
+    (ASSETS_DIR / "data.json").write_bytes(blob)
+    return payload, blob
 
 # ---------- HTML ----------
 HTML_TMPL = r"""<!doctype html>
@@ -292,32 +444,42 @@ a,a:hover{color:#9ecbff}
 </div>
 
 <!-- DATA EMBEBIDA -->
-<script type="application/json" id="PAYLOAD">__PAYLOAD_JSON__</script>
+<script type="application/octet-stream" id="PAYLOAD_GZ">__PAYLOAD_GZ_B64__</script>
 
 <script>
 const cfg = {displayModeBar:false, responsive:true};
-let RAW = []; let FILTERED = [];
+// Almacén columnar: arreglos tipados por campo, texto como códigos sobre DICT[campo]
+const NA = -2147483648;  // fecha faltante en Int32Array
+const CAT_KEYS = ['medico','origen','tipo','cond_egreso','kpc','vi'];
+let N = 0; let COL = {}; let DICT = {}; let MASK = new Uint8Array(0); let NSEL = 0;
+let DATE_MAX = null; let BASE = 0;
 const S = {dateFrom:null,dateTo:null,medico:"",origen:"",tipo:"",cond:"",obitosOnly:false,viOnly:false};
 
 function median(arr){ const v=arr.filter(x=>Number.isFinite(x)).slice().sort((a,b)=>a-b); if(!v.length) return null; const m=Math.floor(v.length/2); return v.length%2?v[m]:(v[m-1]+v[m])/2;}
 function fmtPct(x){ return x==null ? "—" : (x.toFixed(1)+"%"); }
 function setText(id,t){ const el=document.getElementById(id); if(el) el.textContent=(t==null||t==="")?"—":t; }
+// Fechas del payload: días enteros desde payload.base_date
+function isoToOff(iso){ return iso ? Math.round((Date.parse(iso.slice(0,10)+"T00:00:00Z")-BASE)/86400000) : null; }
+function offToIso(off){ return off==null ? null : new Date(BASE+off*86400000).toISOString().slice(0,10); }
+function codeOf(key, label){ return label ? DICT[key].indexOf(label) : -1; }
 function uniqSorted(arr){ return [...new Set(arr.filter(x=>x&&x.trim()))].sort((a,b)=>a.localeCompare(b,'es',{sensitivity:'base'}));}
 
 function applyFilters(){
-  FILTERED = RAW.filter(r=>{
-    if(!r.fec_ing) return false;
-    const d = new Date(r.fec_ing+"T00:00:00Z");
-    if(S.dateFrom && d < new Date(S.dateFrom+"T00:00:00Z")) return false;
-    if(S.dateTo   && d > new Date(S.dateTo+"T00:00:00Z")) return false;
-    if(S.medico && r.medico !== S.medico) return false;
-    if(S.origen && r.origen !== S.origen) return false;
-    if(S.tipo   && r.tipo   !== S.tipo)   return false;
-    if(S.cond   && r.cond_egreso !== S.cond) return false;
-    if(S.obitosOnly && r.cond_egreso !== "Óbito") return false;
-    if(S.viOnly && r.vi !== "Sí") return false;
-    return true;
-  });
+  // Etiquetas -> códigos una sola vez; el bucle compara enteros y escribe MASK
+  const from=isoToOff(S.dateFrom), to=isoToOff(S.dateTo);
+  const med=codeOf('medico',S.medico), org=codeOf('origen',S.origen), tip=codeOf('tipo',S.tipo), cnd=codeOf('cond_egreso',S.cond);
+  const ob=codeOf('cond_egreso',"Óbito"), si=codeOf('vi',"Sí");
+  const fi=COL.fec_ing, cm=COL.medico, co=COL.origen, ct=COL.tipo, cc=COL.cond_egreso, cv=COL.vi;
+  let k=0;
+  for(let i=0;i<N;i++){
+    const d=fi[i];
+    const ok = d!==NA
+      && !(from!=null && d < from) && !(to!=null && d > to)
+      && !(S.medico && cm[i]!==med) && !(S.origen && co[i]!==org) && !(S.tipo && ct[i]!==tip)
+      && !(S.cond && cc[i]!==cnd) && !(S.obitosOnly && cc[i]!==ob) && !(S.viOnly && cv[i]!==si);
+    MASK[i]=ok?1:0; if(ok) k++;
+  }
+  NSEL=k;
   const badge = document.getElementById('activeFilters'); const parts=[];
   if(S.dateFrom||S.dateTo) parts.push(`Fecha: ${S.dateFrom||'…'} → ${S.dateTo||'…'}`);
   if(S.medico) parts.push(`Médico: ${S.medico}`);
@@ -330,14 +492,17 @@ function applyFilters(){
 }
 
 function kpis(){
-  const n=FILTERED.length;
-  const eg=FILTERED.filter(d=>!!d.fec_egr).length;
-  const ob=FILTERED.filter(d=>d.cond_egreso==="Óbito").length;
+  const n=NSEL; const obc=codeOf('cond_egreso',"Óbito"), si=codeOf('vi',"Sí");
+  let eg=0, ob=0, vi=0; const losArr=[], apArr=[], soArr=[];
+  for(let i=0;i<N;i++){
+    if(!MASK[i]) continue;
+    if(COL.fec_egr[i]!==NA) eg++;
+    if(COL.cond_egreso[i]===obc) ob++;
+    if(COL.vi[i]===si) vi++;
+    losArr.push(COL.los[i]); apArr.push(COL.apache2[i]); soArr.push(COL.sofa48[i]);
+  }
   const mort=eg?(ob*100/eg):0;
-  const losArr=FILTERED.map(d=>Number.isFinite(d.los)?d.los:NaN);
-  const apArr =FILTERED.map(d=>Number.isFinite(d.apache2)?d.apache2:NaN);
-  const soArr =FILTERED.map(d=>Number.isFinite(d.sofa48)?d.sofa48:NaN);
-  const viPct=n?(FILTERED.filter(d=>d.vi==="Sí").length*100/n):0;
+  const viPct=n?(vi*100/n):0;
   setText('k_adm',n); setText('k_egr',eg); setText('k_ob',ob); setText('k_mort',fmtPct(mort));
   const mlos=median(losArr); setText('k_los_med', mlos==null?'—':mlos.toFixed(1));
   const map =median(apArr);  setText('k_ap_med',  map==null?'—':map.toFixed(1));
@@ -345,34 +510,37 @@ function kpis(){
   setText('k_vi', n?fmtPct(viPct):'—');
 }
 
-function groupCount(arr, key, topN=null){
-  const m=new Map(); for(const r of arr){ const v=(r[key]||'—').trim()||'—'; m.set(v,(m.get(v)||0)+1); }
+function groupCount(key, topN=null){
+  // Conteo por código; el orden de aparición se conserva para desempatar igual que antes
+  const c=COL[key], dict=DICT[key], cnt=new Int32Array(dict.length), order=[];
+  for(let i=0;i<N;i++){ if(MASK[i] && cnt[c[i]]++===0) order.push(c[i]); }
+  const m=new Map(); for(const j of order){ const v=(dict[j]||'—').trim()||'—'; m.set(v,(m.get(v)||0)+cnt[j]); }
   let a=[...m.entries()].sort((x,y)=>y[1]-x[1]); if(topN) a=a.slice(0,topN);
   return { labels:a.map(x=>x[0]), values:a.map(x=>x[1]) };
 }
-function timeSeries(arr){ const m=new Map(); for(const r of arr){ if(!r.fec_ing) continue; m.set(r.fec_ing,(m.get(r.fec_ing)||0)+1); } const dates=[...m.keys()].sort(); return {x:dates,y:dates.map(d=>m.get(d))}; }
+function timeSeries(){ const m=new Map(); const fi=COL.fec_ing; for(let i=0;i<N;i++){ if(!MASK[i]||fi[i]===NA) continue; m.set(fi[i],(m.get(fi[i])||0)+1); } const days=[...m.keys()].sort((a,b)=>a-b); return {x:days.map(offToIso),y:days.map(d=>m.get(d))}; }
 
 function buildCharts(){
-  const ts=timeSeries(FILTERED);
+  const ts=timeSeries();
   Plotly.react('g_ts', [{x:ts.x,y:ts.y,type:'scatter',mode:'lines+markers',fill:'tozeroy',name:'Admisiones'}],
     {margin:{l:40,r:10,t:10,b:30},xaxis:{rangeslider:{visible:true}},yaxis:{title:"Admisiones/día"},paper_bgcolor:'rgba(0,0,0,0)',plot_bgcolor:'rgba(0,0,0,0)'},{displayModeBar:false,responsive:true});
-  const med=groupCount(FILTERED,'medico',10);
+  const med=groupCount('medico',10);
   Plotly.react('g_med',[{x:med.values.reverse(),y:med.labels.slice().reverse(),type:'bar',orientation:'h'}],
     {margin:{l:120,r:20,t:10,b:30},xaxis:{title:'Casos'},paper_bgcolor:'rgba(0,0,0,0)',plot_bgcolor:'rgba(0,0,0,0)'},{displayModeBar:false,responsive:true});
-  const org=groupCount(FILTERED,'origen',10);
+  const org=groupCount('origen',10);
   Plotly.react('g_org',[{x:org.values.reverse(),y:org.labels.slice().reverse(),type:'bar',orientation:'h'}],
     {margin:{l:120,r:20,t:10,b:30},xaxis:{title:'Casos'},paper_bgcolor:'rgba(0,0,0,0)',plot_bgcolor:'rgba(0,0,0,0)'},{displayModeBar:false,responsive:true});
-  const tip=groupCount(FILTERED,'tipo',10);
+  const tip=groupCount('tipo',10);
   Plotly.react('g_tipo',[{x:tip.values.reverse(),y:tip.labels.slice().reverse(),type:'bar',orientation:'h'}],
     {margin:{l:120,r:20,t:10,b:30},xaxis:{title:'Casos'},paper_bgcolor:'rgba(0,0,0,0)',plot_bgcolor:'rgba(0,0,0,0)'},{displayModeBar:false,responsive:true});
-  const cond=groupCount(FILTERED,'cond_egreso');
+  const cond=groupCount('cond_egreso');
   Plotly.react('g_cond',[{labels:cond.labels,values:cond.values,type:'pie',hole:.45}],
     {margin:{l:10,r:10,t:10,b:10},legend:{orientation:'h'},paper_bgcolor:'rgba(0,0,0,0)',plot_bgcolor:'rgba(0,0,0,0)'},{displayModeBar:false,responsive:true});
-  const los=FILTERED.map(d=>Number.isFinite(d.los)?d.los:null).filter(x=>Number.isFinite(x));
-  const maxLos=Math.max(1,...los,1);
+  const los=[]; let maxLos=1;
+  for(let i=0;i<N;i++){ const v=COL.los[i]; if(MASK[i] && Number.isFinite(v)){ los.push(v); if(v>maxLos) maxLos=v; } }
   Plotly.react('g_los',[{x:los,type:'histogram',xbins:{start:0,end:maxLos,size:1}}],
     {margin:{l:40,r:10,t:10,b:30},xaxis:{title:'Días'},yaxis:{title:'Pacientes'},paper_bgcolor:'rgba(0,0,0,0)',plot_bgcolor:'rgba(0,0,0,0)'},{displayModeBar:false,responsive:true});
-  const kpc=groupCount(FILTERED,'kpc');
+  const kpc=groupCount('kpc');
   Plotly.react('g_kpc',[{x:kpc.values.reverse(),y:kpc.labels.slice().reverse(),type:'bar',orientation:'h'}],
     {margin:{l:120,r:20,t:10,b:30},xaxis:{title:'Pacientes'},paper_bgcolor:'rgba(0,0,0,0)',plot_bgcolor:'rgba(0,0,0,0)'},{displayModeBar:false,responsive:true});
 }
@@ -399,9 +567,8 @@ function attachInteractions(){
       const q=btn.getAttribute('data-quick');
       if(q==='all'){ S.dateFrom=null; S.dateTo=null; document.getElementById('fIni').value=''; document.getElementById('fFin').value=''; }
       else{
-        const dates=[...new Set(RAW.map(r=>r.fec_ing))].sort();
-        if(!dates.length){ refreshAll(); return; }
-        const maxd=dates[dates.length-1];
+        if(!DATE_MAX){ refreshAll(); return; }
+        const maxd=DATE_MAX;
         const from=new Date(maxd); from.setDate(from.getDate()-parseInt(q,10));
         S.dateFrom=from.toISOString().slice(0,10); S.dateTo=maxd;
         document.getElementById('fIni').value=S.dateFrom; document.getElementById('fFin').value=S.dateTo;
@@ -423,34 +590,45 @@ function setSelectOptions(id, values){
   if(values.includes(keep)) sel.value=keep;
 }
 
-function refreshAll(){ applyFilters(); document.getElementById('noData').classList.toggle('d-none', FILTERED.length>0); kpis(); buildCharts(); }
+function refreshAll(){ applyFilters(); document.getElementById('noData').classList.toggle('d-none', NSEL>0); kpis(); buildCharts(); }
 
-function tryInitFromEmbedded(){
+async function tryInitFromEmbedded(){
+  // Payload embebido como gzip+base64: se descomprime con DecompressionStream nativo
   try{
-    const raw = document.getElementById('PAYLOAD').textContent;
-    if(!raw) return null;
-    return JSON.parse(raw);
+    const b64 = document.getElementById('PAYLOAD_GZ').textContent.trim();
+    if(!b64) return null;
+    const bin = Uint8Array.from(atob(b64), c=>c.charCodeAt(0));
+    const stream = new Blob([bin]).stream().pipeThrough(new DecompressionStream('gzip'));
+    return await new Response(stream).json();
   }catch(e){ console.warn('No payload embebido', e); return null; }
 }
 
 async function bootstrap(){
-  let payload = tryInitFromEmbedded();
+  let payload = await tryInitFromEmbedded();
   if(!payload){
     // Fallback: intentar assets/data.json por si existe
     try{
       const r=await fetch('assets/data.json'); if(r.ok){ payload=await r.json(); }
     }catch(e){ console.error(e); }
   }
-  if(!payload || !payload.records){ document.getElementById('noData').classList.remove('d-none'); return; }
-  RAW = payload.records;
+  if(!payload || payload.schema!==2 || !payload.columns){ document.getElementById('noData').classList.remove('d-none'); return; }
+  // Columnas -> arreglos tipados (null -> NA en fechas, NaN en medidas)
+  const C = payload.columns; N = payload.n || 0; DICT = payload.dictionaries || {};
+  const i32 = a => Int32Array.from(a, v => v==null ? NA : v);
+  const f64 = a => Float64Array.from(a, v => v==null ? NaN : v);
+  COL = {fec_ing:i32(C.fec_ing), fec_egr:i32(C.fec_egr), los:f64(C.los), apache2:f64(C.apache2), sofa48:f64(C.sofa48)};
+  for(const k of CAT_KEYS){ COL[k] = (DICT[k].length > 65535 ? Int32Array : Uint16Array).from(C[k]); }
+  MASK = new Uint8Array(N);
   document.getElementById('updated').textContent = "Actualizado: " + (payload.updated || "—");
-  setSelectOptions('fMed',  [...new Set(RAW.map(r=>r.medico))].filter(Boolean).sort());
-  setSelectOptions('fOrg',  [...new Set(RAW.map(r=>r.origen))].filter(Boolean).sort());
-  setSelectOptions('fTipo', [...new Set(RAW.map(r=>r.tipo))].filter(Boolean).sort());
+  // listas de filtros: los diccionarios ya vienen ordenados y sin repetidos desde Python
+  setSelectOptions('fMed',  DICT.medico.filter(Boolean));
+  setSelectOptions('fOrg',  DICT.origen.filter(Boolean));
+  setSelectOptions('fTipo', DICT.tipo.filter(Boolean));
+  DATE_MAX = payload.date_max || null;
+  BASE = payload.base_date ? Date.parse(payload.base_date+"T00:00:00Z") : 0;
   // rango por defecto: últimos 180 días
-  const dates=[...new Set(RAW.map(r=>r.fec_ing))].filter(Boolean).sort();
-  if(dates.length){
-    const maxd=dates[dates.length-1]; const from=new Date(maxd); from.setDate(from.getDate()-180);
+  if(DATE_MAX){
+    const maxd=DATE_MAX; const from=new Date(maxd); from.setDate(from.getDate()-180);
     S.dateFrom=from.toISOString().slice(0,10); S.dateTo=maxd;
     document.getElementById('fIni').value=S.dateFrom; document.getElementById('fFin').value=S.dateTo;
   }
@@ -462,16 +640,20 @@ bootstrap();
 </html>
 """
 
-def write_plotly_html(payload: dict):
-    html = HTML_TMPL.replace("__PAYLOAD_JSON__", json.dumps(payload, ensure_ascii=False))
-    (REPORT_DIR / "index.html").write_text(html, encoding="utf-8")
+# Plantilla partida una sola vez en bytes: antes y después del marcador del payload
+_HTML_PRE, _HTML_POST = HTML_TMPL.encode("utf-8").split(b"__PAYLOAD_GZ_B64__")
+
+def write_plotly_html(blob: bytes):
+    # gzip (mtime=0: mismo HTML para el mismo payload) + base64 para ir dentro de <script>
+    gz = base64.b64encode(gzip.compress(blob, compresslevel=6, mtime=0))
+    with open(REPORT_DIR / "index.html", "wb") as fh:
+        fh.write(_HTML_PRE); fh.write(gz); fh.write(_HTML_POST)
 
 # ---------- main ----------
 def main():
-    df_raw = load_data()
-    df = prepare(df_raw)
-    payload = export_payload(df)   # guarda report/assets/data.json y devuelve dict
-    write_plotly_html(payload)     # genera report/index.html con DATA embebida
+    df = load_prepared()           # hoja (CSV o Service Account) + prepare(), o la caché si no cambió
+    _, blob = export_payload(df)   # guarda report/assets/data.json y devuelve (dict, bytes)
+    write_plotly_html(blob)        # genera report/index.html con DATA embebida
 
 if __name__ == "__main__":
     main()